@@ -1,21 +1,64 @@
+import copy
 import unittest
-from unittest.mock import patch, MagicMock
-from datetime import timedelta
+from ddt import ddt, data
+from unittest.mock import patch, MagicMock, create_autospec
 from src.models.models import Command
 from src.device.base import BaseDevice
-from pysnmp.proto.rfc1902 import TimeTicks 
 from src.connector.conector_factory import ConnectorFactory
-from src.connector.netmiko_connector import NetmikoConnector, NetMikoAuthenticationException, NetMikoTimeoutException
+from src.connector.netmiko_connector import NetmikoConnector, NetMikoAuthenticationException, NetMikoTimeoutException, GLOBAL_DRIVER_CACHING
+from src.connector.netmiko_connector import SNMPDetect, SSHDetect
 from src.models.m_errors import *
 from src.connector.snmp_connector import SNMPConnector
 from src.connector.rest_connector import RestConnector, ViptelaRestConnector
 
-class MockDeviceBase(BaseDevice):
-    def __init__(self, ip, name, type, port, vendor, os, driver=None):
-        super().__init__(ip, name, type, port, vendor, os, driver)
+_FACTORY = ConnectorFactory()
+_CONNECTOR_NAMES = tuple(_FACTORY.connectors)
+
+# Expected uptime string for the fixed TimeTicks used in the TIMETICKS test
+_TT_VAL = 937800
+_tt_hours, _tt_minutes = divmod(_TT_VAL // 6000, 60)  # ticks are 1/100 s
+_tt_days, _tt_hours = divmod(_tt_hours, 24)
+EXPECTED_TT_OUTPUT = (
+    f"{_tt_days} days, {_tt_hours} hours, {_tt_minutes} minutes"
+    if _tt_days
+    else f"{_tt_hours} hours, {_tt_minutes} minutes"
+)
+
+# nextCmd rows as (error_indication, error_status, error_index, var_binds)
+_MOCK_PP = MagicMock(prettyPrint=lambda: 'Test SNMP Response')
+_SNMP_OK = [(None, None, None, [(None, _MOCK_PP)])]
+_SNMP_ERROR_INDICATION = [('error1', None, None, [(None, None)])]
+_SNMP_ERROR_STATUS = [(None, 'error2', None, [(None, None)])]
+
+# vManage responses: successful login, JSON data and the login page returned on failure
+_EMPTY_RESP = MagicMock(content=b'')
+_JSON_RESP = MagicMock(content=b'{"mock": "value"}')
+_HTML_RESP = MagicMock(content=b'<html>')
 
+_GENERAL_ERR = Exception('Test General Error')
+_SNMP_DETECT_ERR = Exception('Test SNMP Detect Exception')
+_SSH_DETECT_ERR = Exception('Test SSH Detect Exception')
+
+# (case, with_community, SNMPDetect.autodetect config, SSHDetect.autodetect config, result field, expected)
+_NETMIKO_DETECT_CASES = (
+    ('snmp_detect', True, {'return_value': 'cisco_ios'}, {}, 'output', 'Test Netmiko Response'),
+    ('ssh_detect', True, {'return_value': None}, {'return_value': 'cisco_ios'}, 'output', 'Test Netmiko Response'),
+    (
+        'snmp_detect_exception', True,
+        {'side_effect': _SNMP_DETECT_ERR}, {'return_value': 'cisco_ios'},
+        'error', NetmikoErrors.DETECTION_ERROR.value,
+    ),
+    (
+        'ssh_detect_exception', False,
+        {'return_value': _SNMP_DETECT_ERR}, {'side_effect': _SSH_DETECT_ERR},
+        'error', NetmikoErrors.SSH_DETECT_ERROR.value,
+    ),
+)
+
+class MockDeviceBase(BaseDevice):
+    # Plain stub: the fixture IP is known to be valid, skip the IP property validation
     def get_ip(self):
-        return self.IP
+        return self._ip
     
     def get_driver(self):
         return self.DRIVER
@@ -29,10 +72,12 @@ class MockDeviceBase(BaseDevice):
     def get_type(self):
         return self.TYPE
 
+@ddt
 class TestConnectorFactory(unittest.TestCase):
-    
-    def setUp(self) -> None:
-        self.geral_commandTest = Command(
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.geral_commandTest = Command(
             command='pode_ser_qlqr)_coisa',
             type='router',
             os='ios',
@@ -42,7 +87,7 @@ class TestConnectorFactory(unittest.TestCase):
             group=1,
             parse='mock',
         )
-        dev = {
+        cls.dev = {
             'ip': '192.168.1.1',
             'name': 'device',
             'type': 'router',
@@ -51,77 +96,95 @@ class TestConnectorFactory(unittest.TestCase):
             'os': 'ios',
             'driver': 'ssh',
             }
-        self.device = MockDeviceBase(**dev)
-        self.device.set_credentials(
-            {
-                "vmanage_ip": '1.2.3.4',
-                "j_username": 'user',
-                "j_password": 'pass',
-                "community": "public",
-                "username": "user",
-                "password": "pass",
-            }
-        )
-        self.device_ip = self.device.IP
+        cls.credentials = {
+            "vmanage_ip": '1.2.3.4',
+            "j_username": 'user',
+            "j_password": 'pass',
+            "community": "public",
+            "username": "user",
+            "password": "pass",
+        }
+        # Shared read-only device, tests that change credentials work on a shallow copy
+        cls.device = MockDeviceBase(**cls.dev)
+        cls.device.set_credentials(cls.credentials)
+        cls.device_ip = cls.device.IP
+
+        # Connectors keep no state between runs, one instance per type is reused
+        cls.snmp = SNMPConnector()
+        cls.netmiko = NetmikoConnector()
+        cls.viptela = ViptelaRestConnector()
+
+        # One vManage session graph shared by the REST tests, each test sets the login response
+        cls._mock_session = MagicMock()
+        cls._mock_session.get.return_value = _JSON_RESP
 
+        # Netmiko patches are started once for the class and reset before each test
+        # The detector specs are built once here and handed to patch via new=
+        cls.mock_snmp_detect = create_autospec(SNMPDetect)
+        cls.mock_ssh_detect = create_autospec(SSHDetect)
+        connect_handler_patcher = patch('src.connector.netmiko_connector.ConnectHandler')
+        snmp_detect_patcher = patch('src.connector.netmiko_connector.SNMPDetect', new=cls.mock_snmp_detect)
+        ssh_detect_patcher = patch('src.connector.netmiko_connector.SSHDetect', new=cls.mock_ssh_detect)
+        cls.mock_connect_handler = connect_handler_patcher.start()
+        cls.addClassCleanup(connect_handler_patcher.stop)
+        snmp_detect_patcher.start()
+        cls.addClassCleanup(snmp_detect_patcher.stop)
+        ssh_detect_patcher.start()
+        cls.addClassCleanup(ssh_detect_patcher.stop)
+
+    def setUp(self) -> None:
+        self._reset_netmiko_state()
+
+    def _reset_netmiko_state(self) -> None:
+        # The driver cache is module state, clear it so tests don't depend on run order
+        GLOBAL_DRIVER_CACHING.clear()
+        self.mock_connect_handler.reset_mock(return_value=True, side_effect=True)
+        for mock_detect in (self.mock_snmp_detect, self.mock_ssh_detect):
+            # Resetting return_value on the class mock would drop the autospec'd instance
+            mock_detect.reset_mock()
+            mock_detect.return_value.autodetect.reset_mock(return_value=True, side_effect=True)
+
+    @data(*_CONNECTOR_NAMES)
     @patch('src.connector.conector_factory.ConnectorFactory.create_connector')
-    def test_create_connector_w_mock(self, mock_create_connector):
-        for connector_name, connector_class in  ConnectorFactory().connectors.items():
-            with self.subTest(connector_name=connector_name):
-                mock_create_connector.return_value = connector_class
-                connector = ConnectorFactory().create_connector(connector_name)
-                self.assertIsInstance(connector, (NetmikoConnector, SNMPConnector, RestConnector))
+    def test_create_connector_w_mock(self, connector_name, mock_create_connector):
+        mock_create_connector.return_value = _FACTORY.connectors[connector_name]
+        connector = _FACTORY.create_connector(connector_name)
+        self.assertIsInstance(connector, (NetmikoConnector, SNMPConnector, RestConnector))
 
-    def test_create_connector_w_no_mock(self):
-        for connector_name,_ in ConnectorFactory().connectors.items():
-            with self.subTest(connector_name=connector_name):
-                connector = ConnectorFactory().create_connector(connector_name)
-                self.assertIsInstance(connector, (NetmikoConnector, SNMPConnector, RestConnector))
+    @data(*_CONNECTOR_NAMES)
+    def test_create_connector_w_no_mock(self, connector_name):
+        connector = _FACTORY.create_connector(connector_name)
+        self.assertIsInstance(connector, (NetmikoConnector, SNMPConnector, RestConnector))
                 
     def test_create_connector_w_no_mock_exception(self):
         with self.assertRaises(Exception) as context:
-            ConnectorFactory().create_connector('invalid_connector')
+            _FACTORY.create_connector('invalid_connector')
         self.assertEqual(str(context.exception), 'Connector invalid_connector not found')
 
-    @patch('src.connector.snmp_connector.nextCmd')
-    def test_snmp_connector_success(self, mock_next_cmd):
-        mock_next_cmd.return_value = iter([
-            (None, None, None, [(None, MagicMock(prettyPrint=lambda: 'Test SNMP Response'))])
-        ])
-        
-        connector = SNMPConnector()
-        result = connector.run(self.device, self.geral_commandTest)
+    def test_snmp_connector_success(self):
+        connector = self.snmp
+        with patch('src.connector.snmp_connector.nextCmd', return_value=iter(_SNMP_OK)):
+            result = connector.run(self.device, self.geral_commandTest)
         
         self.assertEqual(result.output, 'Test SNMP Response')
         
     
-    @patch('src.connector.snmp_connector.nextCmd')
-    def test_snmp_connector_TIMETICKS_success(self, mock_next_cmd):
-        time_ticks = TimeTicks(937800)
-
-        mock_next_cmd.return_value = iter([
-            (None, None, None, [(None, time_ticks)])
-        ])
+    def test_snmp_connector_TIMETICKS_success(self):
+        from pysnmp.proto.rfc1902 import TimeTicks
+        time_ticks = TimeTicks(_TT_VAL)
         
         # Instanciando o conector e executando
-        connector = SNMPConnector()
-        result = connector.run(self.device, self.geral_commandTest)
-        
-        # Calculando a saída esperada
-        ticks = int(time_ticks.prettyPrint())
-        delta = timedelta(seconds=ticks / 100)
-        days = delta.days
-        hours, remainder = divmod(delta.seconds, 3600)
-        minutes, _ = divmod(remainder, 60)
-        expected_output = f"{days} days, {hours} hours, {minutes} minutes" if days > 0 else f"{hours} hours, {minutes} minutes"
+        connector = self.snmp
+        with patch('src.connector.snmp_connector.nextCmd', return_value=iter([(None, None, None, [(None, time_ticks)])])):
+            result = connector.run(self.device, self.geral_commandTest)
         
         # Verificações de asserção
-        self.assertEqual(result.output, expected_output)
+        self.assertEqual(result.output, EXPECTED_TT_OUTPUT)
         
     def test_snmp_connector_no_community(self):
 
-        connector = SNMPConnector()
-        device = self.device
+        connector = self.snmp
+        device = copy.copy(self.device)
         device.set_credentials({})
         result = connector.run(device, self.geral_commandTest)
         self.assertEqual(
@@ -129,52 +192,35 @@ class TestConnectorFactory(unittest.TestCase):
             SNMPErrors.COMMUNITY_ERROR.value
         )
         
-    @patch('src.connector.snmp_connector.nextCmd')
-    def test_snmp_connector_errors(self, mock_next_cmd):
-        mock_next_cmd.return_value = iter([
-            ('error1', None, None, [(None, None)])
-        ])
-        
-        connector = SNMPConnector()
-        
-        result = connector.run(self.device, self.geral_commandTest)
-        
-        self.assertEqual(
-            result.error,
-            'error1'
-        )
-        
-        mock_next_cmd.return_value = iter([
-            (None, 'error2', None, [(None, None)])
-        ])
-        
+    def test_snmp_connector_errors(self):
+        connector = self.snmp
         
-        result = connector.run(self.device, self.geral_commandTest)
-        
-        self.assertEqual(
-            result.error,
-            'error2'
-        )
+        for case, snmp_rows, expected in (
+            ('error_indication', _SNMP_ERROR_INDICATION, 'error1'),
+            ('error_status', _SNMP_ERROR_STATUS, 'error2'),
+        ):
+            with self.subTest(case=case):
+                with patch('src.connector.snmp_connector.nextCmd', return_value=iter(snmp_rows)):
+                    result = connector.run(self.device, self.geral_commandTest)
+                
+                self.assertEqual(result.error, expected)
         
-    @patch('requests.session')
-    def test_login_success(self, mock_session):
-        mock_session.return_value = MagicMock()
-        mock_session.return_value.post.return_value = MagicMock(content=b'')
-        mock_session.return_value.get.return_value = MagicMock(content=b'{"mock": "value"}')
+    def test_login_success(self):
+        self._mock_session.post.return_value = _EMPTY_RESP
         
-        connector = ViptelaRestConnector()
-        result = connector.run(self.device, self.geral_commandTest)
+        connector = self.viptela
+        with patch('requests.session', return_value=self._mock_session):
+            result = connector.run(self.device, self.geral_commandTest)
         
         self.assertEqual(result.output, 'value')
         
-    @patch('requests.session')
-    def test_login_failed(self, mock_session):
-        mock_session.return_value = MagicMock()
-        mock_session.return_value.post.return_value = MagicMock(content=b'<html>')
+    def test_login_failed(self):
+        self._mock_session.post.return_value = _HTML_RESP
         
-        connector = ViptelaRestConnector()
+        connector = self.viptela
         
-        result = connector.run(self.device, self.geral_commandTest)
+        with patch('requests.session', return_value=self._mock_session):
+            result = connector.run(self.device, self.geral_commandTest)
         
         self.assertEqual(
             result.error,
@@ -186,108 +232,67 @@ class TestConnectorFactory(unittest.TestCase):
     #SNMPDetect mock
     #SSHDetect mock
     
-    @patch('src.connector.netmiko_connector.SNMPDetect', autospec=True)
-    @patch('src.connector.netmiko_connector.ConnectHandler')
-    def test_netmiko_connector_success_SNMP_DETECT(self, mock_connect_handler, mock_snmp_detect):
-        mock_connect_handler.return_value.__enter__.return_value.send_command.return_value = 'Test Netmiko Response'
-        mock_snmp_detect.return_value.autodetect.return_value = 'cisco_ios'
-        
-        connector = NetmikoConnector()
-        result = connector.run(self.device, self.geral_commandTest)
-        
-        self.assertEqual(result.output, 'Test Netmiko Response')    
-    
-    @patch('src.connector.netmiko_connector.SNMPDetect', autospec=True)
-    @patch('src.connector.netmiko_connector.SSHDetect', autospec=True)
-    @patch('src.connector.netmiko_connector.ConnectHandler')
-    def test_netmiko_connector_success_SSH_DETECT(self, mock_connect_handler, mock_ssh_detect, mock_snmp_detect):
-        mock_connect_handler.return_value.__enter__.return_value.send_command.return_value = 'Test Netmiko Response'
-        mock_snmp_detect.return_value.autodetect.return_value = None
-        mock_ssh_detect.return_value.autodetect.return_value = 'cisco_ios'
-        
-        
-        connector = NetmikoConnector()
-        result = connector.run(self.device, self.geral_commandTest)
-        
-        self.assertEqual(result.output, 'Test Netmiko Response')
-    
-    @patch('src.connector.netmiko_connector.SNMPDetect', autospec=True)
-    @patch('src.connector.netmiko_connector.SSHDetect', autospec=True)
-    @patch('src.connector.netmiko_connector.ConnectHandler')
-    def test_netmiko_connector_SNMP_DETECT_exception(self, mock_connect_handler, mock_ssh_detect, mock_snmp_detect):
-        mock_connect_handler.return_value.__enter__.return_value.send_command.return_value = 'Test Netmiko Response'
-        mock_snmp_detect.return_value.autodetect.side_effect = Exception('Test SNMP Detect Exception')
-        mock_ssh_detect.return_value.autodetect.return_value = 'cisco_ios'
-        
-        connector = NetmikoConnector()
-        result = connector.run(self.device, self.geral_commandTest)
-        
-        self.assertEqual(result.error, NetmikoErrors.DETECTION_ERROR.value)
-        
-    @patch('src.connector.netmiko_connector.SNMPDetect', autospec=True)
-    @patch('src.connector.netmiko_connector.SSHDetect', autospec=True)
-    @patch('src.connector.netmiko_connector.ConnectHandler')
-    def test_netmiko_connector_SSH_DETECT_exception(self, mock_connect_handler, mock_ssh_detect, mock_snmp_detect):
-        mock_connect_handler.return_value.__enter__.return_value.send_command.return_value = 'Test Netmiko Response'
-        mock_snmp_detect.return_value.autodetect.return_value = Exception('Test SNMP Detect Exception')
-        mock_ssh_detect.return_value.autodetect.side_effect = Exception('Test SSH Detect Exception')
-        device = self.device
-        device.CREDENTIALS.pop('community')
-        connector = NetmikoConnector()
-        result = connector.run(self.device, self.geral_commandTest)
-        self.assertEqual(result.error, NetmikoErrors.SSH_DETECT_ERROR.value)
+    def test_netmiko_connector_detect(self):
+        for case, with_community, snmp_autodetect, ssh_autodetect, field, expected in _NETMIKO_DETECT_CASES:
+            with self.subTest(case=case):
+                self._reset_netmiko_state()
+                self.mock_connect_handler.return_value.__enter__.return_value.send_command.return_value = 'Test Netmiko Response'
+                self.mock_snmp_detect.return_value.autodetect.configure_mock(**snmp_autodetect)
+                self.mock_ssh_detect.return_value.autodetect.configure_mock(**ssh_autodetect)
+                device = self.device
+                if not with_community:
+                    device = copy.copy(self.device)
+                    device.set_credentials({k: v for k, v in self.credentials.items() if k != 'community'})
+
+                connector = self.netmiko
+                result = connector.run(device, self.geral_commandTest)
+
+                self.assertEqual(getattr(result, field), expected)
     
     
-    @patch('src.connector.netmiko_connector.SSHDetect', autospec=True)
-    def test_netmiko_connector_try_ssh_autodetect_success(self, mock_ssh_detect_cls):
-        mock_ssh_detect = mock_ssh_detect_cls.return_value
+    def test_netmiko_connector_try_ssh_autodetect_success(self):
+        mock_ssh_detect = self.mock_ssh_detect.return_value
         mock_ssh_detect.autodetect.return_value = 'cisco_ios'
         
-        connector = NetmikoConnector()
+        connector = self.netmiko
         result = connector._NetmikoConnector__try_ssh_autodetect(mock_ssh_detect)
         
         self.assertEqual(result, 'cisco_ios')
     
     def test_netmiko_connector_no_username_password(self):
-        device = self.device
+        device = copy.copy(self.device)
         device.set_credentials({})
-        connector = NetmikoConnector()
+        connector = self.netmiko
         from src.device.base_errors import NoValidCredential
         
         with self.assertRaises(NoValidCredential):
             connector.run(device, self.geral_commandTest)
                 
         
-    @patch('src.connector.netmiko_connector.SNMPDetect', autospec=True)
-    @patch('src.connector.netmiko_connector.ConnectHandler')
     #test_3 exceptions by with connect
-    def test_netmiko_connector_general_error(self, mock_connect_handler, mock_snmp_detect):
-        mock_connect_handler.side_effect = Exception('Test General Error')
+    def test_netmiko_connector_general_error(self):
+        self.mock_connect_handler.side_effect = _GENERAL_ERR
         
-        connector = NetmikoConnector()
+        connector = self.netmiko
         result = connector.run(self.device, self.geral_commandTest)
         
         self.assertEqual(result.error, NetmikoErrors.GENERAL_NETMIKO_ERROR.value)
         
-    @patch('src.connector.netmiko_connector.SNMPDetect', autospec=True)
-    @patch('src.connector.netmiko_connector.ConnectHandler')
     #test_3 exceptions by with connect
-    def test_netmiko_connector_timeout_error(self, mock_connect_handler, mock_snmp_detect):
-        mock_connect_handler.side_effect = NetMikoTimeoutException
+    def test_netmiko_connector_timeout_error(self):
+        self.mock_connect_handler.side_effect = NetMikoTimeoutException
         
-        connector = NetmikoConnector()
+        connector = self.netmiko
         result = connector.run(self.device, self.geral_commandTest)
         
         self.assertEqual(result.error, NetmikoErrors.TIMEOUT_ERROR.value)
         
     
-    @patch('src.connector.netmiko_connector.SNMPDetect', autospec=True)
-    @patch('src.connector.netmiko_connector.ConnectHandler')
     #test_3 exceptions by with connect
-    def test_netmiko_connector_authentication_error(self, mock_connect_handler, mock_snmp_detect):
-        mock_connect_handler.side_effect = NetMikoAuthenticationException
+    def test_netmiko_connector_authentication_error(self):
+        self.mock_connect_handler.side_effect = NetMikoAuthenticationException
         
-        connector = NetmikoConnector()
+        connector = self.netmiko
         result = connector.run(self.device, self.geral_commandTest)
         
         self.assertEqual(result.error, NetmikoErrors.AUTH_ERROR.value)